@@ -0,0 +1,52 @@
+# cython: language_level=3
+"""
+chinese_to_arabic 的 Cython 加速实现（可选）
+
+编译方法（需要安装 Cython 和 C 编译器）:
+    cythonize -i _chinese_num.pyx
+未编译时 chinese_to_arabic.py 会自动使用纯 Python 版本
+"""
+
+cdef inline long long _num_value(Py_UCS4 ch):
+    """返回单个中文数字字符对应的数值，非数字字符返回 -1"""
+    if ch == u'零': return 0
+    if ch == u'一': return 1
+    if ch == u'二': return 2
+    if ch == u'三': return 3
+    if ch == u'四': return 4
+    if ch == u'五': return 5
+    if ch == u'六': return 6
+    if ch == u'七': return 7
+    if ch == u'八': return 8
+    if ch == u'九': return 9
+    if ch == u'十': return 10
+    if ch == u'百': return 100
+    if ch == u'千': return 1000
+    if ch == u'万': return 10000
+    if ch == u'亿': return 100000000
+    return -1
+
+def chinese_to_arabic(str chinese_num):
+    """高效转换中文数字到阿拉伯数字（支持复合数字）"""
+    cdef long long total = 0
+    cdef long long current = 0
+    cdef long long value
+    cdef Py_UCS4 ch
+
+    if chinese_num.isdigit():
+        return int(chinese_num)
+
+    for ch in chinese_num:
+        value = _num_value(ch)
+        if value < 0:
+            continue
+
+        if value >= 10:  # 处理单位
+            if current == 0:
+                current = 1
+            total += current * value
+            current = 0
+        else:
+            current = value
+
+    return total + current
@@ -2,11 +2,27 @@ import os
 import re
 import argparse
 import sys
-from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import time
+import asyncio
+import multiprocessing
+from functools import lru_cache
 import platform
+from collections import Counter
 
+# 进度刷新间隔（文件数）
+PROGRESS_INTERVAL = 500
+
+# 异步模式下同时进行的重命名数量上限
+ASYNC_CONCURRENCY = 128
+
+# 启用多进程计算新文件名的最少文件数（文件较少时进程启动开销得不偿失）
+PROCS_MIN_FILES = 500
+
+# 预编译的章节编号匹配模式（合并为单个正则，每个文件只扫描一次）
+_PAD_RE = re.compile(r'(第)(\d+)(章|节|集|话|部分|卷)')
+
+@lru_cache(maxsize=8192)
 def pad_chapter_number(filename):
     """
     在章节编号前补0，确保章节编号至少4位
@@ -14,53 +30,121 @@ def pad_chapter_number(filename):
         "第254章 内容介绍.mp3" -> "第0254章 内容介绍.mp3"
         "第1节 开端.txt" -> "第0001节 开端.txt"
     """
-    patterns = [
-        r'(第)(\d+)(章)',
-        r'(第)(\d+)(节)',
-        r'(第)(\d+)(集)',
-        r'(第)(\d+)(话)',
-        r'(第)(\d+)(部分)',
-        r'(第)(\d+)(卷)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename)
-        if match:
-            prefix = match.group(1)  # "第"
-            number = match.group(2)  # "254"
-            suffix = match.group(3)  # "章"
-            
-            # 将数字补零到至少4位
-            padded_number = number.zfill(4)
-            
-            # 构造新章节字符串
-            new_chapter = f"{prefix}{padded_number}{suffix}"
-            
-            # 替换原章节字符串
-            return filename.replace(match.group(0), new_chapter)
+    # 不含"第"的文件名不可能匹配，直接跳过正则
+    if '第' not in filename:
+        return filename
+    
+    match = _PAD_RE.search(filename)
+    if match:
+        prefix = match.group(1)  # "第"
+        number = match.group(2)  # "254"
+        suffix = match.group(3)  # "章"
+        
+        # 已满4位无需补零，原样返回（不分配新字符串，也不会进入重命名队列）
+        if len(number) >= 4:
+            return filename
+        
+        # 将数字补零到至少4位
+        padded_number = '0' * (4 - len(number)) + number
+        
+        # 按匹配位置拼接新文件名（不再二次扫描，也不会误替换其他相同片段）
+        return f"{filename[:match.start()]}{prefix}{padded_number}{suffix}{filename[match.end():]}"
     
     return filename
 
-def process_file(args):
-    """处理单个文件（多线程工作函数）"""
-    file_path, dry_run, counter = args
-    filename = os.path.basename(file_path)
-    dirname = os.path.dirname(file_path)
-    
+def _compute_entry(entry):
+    """计算单个文件的新文件名（可在子进程中执行），无需重命名时返回 None"""
+    dirpath, filename = entry
     new_name = pad_chapter_number(filename)
-    
     if new_name != filename:
-        dst = os.path.join(dirname, new_name)
-        if not dry_run:
-            try:
-                os.rename(file_path, dst)
-                return (file_path, dst, True, None)
-            except Exception as e:
-                return (file_path, None, False, str(e))
-        return (file_path, dst, True, None)
-    return (file_path, file_path, False, None)
+        return (dirpath, filename, new_name)
+    return None
+
+def _plan_renames(file_list, procs=0):
+    """计算需要重命名的文件（纯字符串处理，默认在主线程中串行执行）
+    
+    目标文件名重复、或与目录中已有文件（含未被扫描的文件，如被排除的文件或大小写不敏感
+    文件系统上的同名文件）同名的条目视为冲突，不参与重命名。
+    procs > 1 且文件数不少于 PROCS_MIN_FILES 时使用多进程并行计算。
+    返回 (renames, conflicts)，两者均为 (源路径, 目标路径) 列表
+    """
+    if procs > 1 and len(file_list) >= PROCS_MIN_FILES:
+        # 正则匹配受 GIL 限制，多进程才能真正并行；较大的 chunksize 用于摊薄进程间通信开销
+        with multiprocessing.Pool(procs) as pool:
+            results = pool.imap_unordered(_compute_entry, file_list, chunksize=256)
+            # 子进程返回的结果经过反序列化，目录字符串需重新驻留以恢复共享
+            planned = [(sys.intern(r[0]), r[1], r[2]) for r in results if r]
+    else:
+        planned = [r for r in map(_compute_entry, file_list) if r]
+    
+    existing = set(file_list)
+    dst_counts = Counter((dirpath, new_name) for dirpath, _, new_name in planned)
+    
+    renames = []
+    conflicts = []
+    for dirpath, filename, new_name in planned:
+        key = (dirpath, new_name)
+        paths = (os.path.join(dirpath, filename), os.path.join(dirpath, new_name))
+        if dst_counts[key] > 1 or key in existing or os.path.lexists(paths[1]):
+            conflicts.append(paths)
+        else:
+            renames.append(paths)
+    return renames, conflicts
+
+def _do_rename(src, dst):
+    """执行实际的重命名操作（多线程工作函数，仅承担 I/O）"""
+    try:
+        os.replace(src, dst)
+        return (src, dst, True, None)
+    except Exception as e:
+        return (src, dst, False, str(e))
+
+def _iter_files(root, exts):
+    """用 os.scandir 递归遍历目录，逐个产出扩展名受支持的文件 (所在目录, 文件名)"""
+    stack = [root]
+    while stack:
+        # 同一目录下的所有文件共享同一个驻留的目录字符串
+        current = sys.intern(stack.pop())
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    # 与 os.walk 一致：不进入指向目录的符号链接，但指向文件的符号链接照常处理
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        name = entry.name
+                        dot = name.rfind('.')
+                        if dot >= 0 and name[dot:].lower() in exts:
+                            yield (current, name)
+        except OSError:
+            # 与 os.walk 一致：跳过无法访问的目录
+            continue
 
-def pad_filenames(directory, dry_run=False, max_workers=4, output_log=None):
+def _run_async_renames(renames, on_result, concurrency=ASYNC_CONCURRENCY):
+    """使用 asyncio 以高并发执行重命名（适用于 SMB/NFS 等网络存储）
+    
+    固定数量的工作协程共享同一个任务迭代器，在途任务数不随文件数增长；
+    每完成一个任务即调用 on_result(结果)
+    """
+    async def rename_all(executor):
+        loop = asyncio.get_event_loop()
+        tasks = iter(renames)
+        
+        async def worker():
+            # 事件循环是单线程的，多个协程共享同一迭代器是安全的
+            for src, dst in tasks:
+                on_result(await loop.run_in_executor(executor, _do_rename, src, dst))
+        
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    
+    loop = asyncio.new_event_loop()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            loop.run_until_complete(rename_all(executor))
+    finally:
+        loop.close()
+
+def pad_filenames(directory, dry_run=False, max_workers=4, output_log=None, use_async=False, procs=0):
     """在文件名章节编号前补0"""
     # 支持的文件扩展名（音频 + 文本）
     supported_extensions = {
@@ -70,80 +154,135 @@ def pad_filenames(directory, dry_run=False, max_workers=4, output_log=None):
         '.txt'
     }
     
-    file_list = []
-    log_entries = []
-    
-    # 收集所有支持的文件路径
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_ext = Path(file).suffix.lower()
-            if file_ext in supported_extensions:
-                file_list.append(os.path.join(root, file))
+    # 收集所有支持的文件（目录与文件名分开保存，避免逐个拆分路径）
+    file_list = list(_iter_files(directory, supported_extensions))
     
     total_files = len(file_list)
     if total_files == 0:
         print(f"在 {directory} 中未找到支持的文件格式")
         print(f"支持的格式: {', '.join(supported_extensions)}")
-        return 0, log_entries
+        return 0, 0
     
     print(f"找到 {total_files} 个文件，开始处理章节编号补零...")
     changed_count = 0
     error_count = 0
-    start_time = time.time()
+    completed_count = 0
+    start_time = time.perf_counter()
+    
+    # 日志文件在处理前打开，每条记录经 64KB 缓冲区直接写出，不在内存中累积
+    log_file = None
+    
+    def write_log(entry):
+        """写入一条日志记录；写入失败时报告一次并停止记录，不中断处理"""
+        nonlocal log_file
+        if log_file:
+            try:
+                log_file.write(entry)
+                log_file.write('\n')
+            except (OSError, ValueError) as e:
+                print(f"\n无法写入日志文件: {str(e)}")
+                try:
+                    log_file.close()
+                except (OSError, ValueError):
+                    pass
+                log_file = None
     
-    # 使用多线程处理
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future = executor.map(process_file, [(f, dry_run, i) for i, f in enumerate(file_list)])
-        
-        for i, (src, dst, changed, error) in enumerate(future, 1):
-            if changed:
-                changed_count += 1
-                if dry_run:
-                    log_entry = f"[试运行] 将重命名: {src} -> {dst}"
-                    print(log_entry)
-                    log_entries.append(log_entry)
-                else:
-                    if error:
-                        log_entry = f"[错误] 重命名失败 ({src}): {error}"
-                        print(log_entry)
-                        log_entries.append(log_entry)
-                        error_count += 1
-                    else:
-                        log_entry = f"已重命名: {src} -> {dst}"
-                        log_entries.append(log_entry)
-            
-            # 进度显示
-            elapsed = time.time() - start_time
-            files_per_sec = i / elapsed if elapsed > 0 else 0
-            
-            # 每100个文件或最后更新一次进度
-            if i % 100 == 0 or i == total_files:
-                progress_percent = (i / total_files) * 100
-                print(f"\r进度: {i}/{total_files} [{progress_percent:.1f}%] | "
-                      f"速度: {files_per_sec:.2f} 文件/秒 | "
-                      f"已更改: {changed_count} | "
-                      f"错误: {error_count}", end='', flush=True)
-    
-    # 最终状态显示
-    elapsed = time.time() - start_time
-    print(f"\n处理完成! 用时: {elapsed:.2f}秒 | 总文件: {total_files} | 已更改: {changed_count} | 错误: {error_count}")
-    
-    # 写入日志文件
     if output_log:
         try:
-            with open(output_log, 'w', encoding='utf-8') as log_file:
-                log_file.write(f"处理目录: {directory}\n")
-                log_file.write(f"开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                log_file.write(f"总文件数: {total_files}\n")
-                log_file.write(f"已更改文件: {changed_count}\n")
-                log_file.write(f"错误数: {error_count}\n")
-                log_file.write(f"用时: {elapsed:.2f}秒\n\n")
-                log_file.write("详细操作日志:\n")
-                for entry in log_entries:
-                    log_file.write(entry + "\n")
-            print(f"操作日志已保存至: {output_log}")
-        except Exception as e:
+            # 非 UTF-8 文件名（以代理字符表示）转义写出，避免编码错误
+            log_file = open(output_log, 'w', encoding='utf-8', errors='backslashreplace', buffering=65536)
+        except (OSError, ValueError) as e:
             print(f"无法写入日志文件: {str(e)}")
+        write_log(f"处理目录: {directory}")
+        write_log(f"开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        write_log(f"总文件数: {total_files}\n")
+        write_log("详细操作日志:")
+    
+    try:
+        # 文件名计算受 GIL 限制，默认在主线程串行完成（--procs 可启用多进程）；冲突在任何系统调用之前排除
+        renames, conflicts = _plan_renames(file_list, procs)
+        for src, dst in conflicts:
+            error_count += 1
+            log_entry = f"[冲突] 目标文件名重复或已存在，跳过: {src} -> {dst}"
+            print(log_entry)
+            write_log(log_entry)
+        
+        total_renames = len(renames)
+        
+        def show_progress(i):
+            """显示进度（仅在输出时读取时钟）"""
+            elapsed = time.perf_counter() - start_time
+            files_per_sec = i / elapsed if elapsed > 0 else 0
+            progress_percent = (i / total_renames) * 100
+            print(f"\r进度: {i}/{total_renames} [{progress_percent:.1f}%] | "
+                  f"速度: {files_per_sec:.2f} 文件/秒 | "
+                  f"已更改: {changed_count} | "
+                  f"错误: {error_count}", end='', flush=True)
+        
+        def record_result(result):
+            """汇总一个重命名任务的结果，并按已完成数量更新进度"""
+            nonlocal changed_count, error_count, completed_count
+            src, dst, ok, error = result
+            if ok:
+                changed_count += 1
+                write_log(f"已重命名: {src} -> {dst}")
+            else:
+                error_count += 1
+                log_entry = f"[错误] 重命名失败 ({src}): {error}"
+                print(log_entry)
+                write_log(log_entry)
+            
+            # 每完成 PROGRESS_INTERVAL 个或全部完成时更新一次进度
+            completed_count += 1
+            if completed_count % PROGRESS_INTERVAL == 0 or completed_count == total_renames:
+                show_progress(completed_count)
+        
+        if dry_run:
+            # 试运行只列出将要进行的更改，不启动线程池
+            for i, (src, dst) in enumerate(renames, 1):
+                changed_count += 1
+                log_entry = f"[试运行] 将重命名: {src} -> {dst}"
+                print(log_entry)
+                write_log(log_entry)
+                
+                if i % PROGRESS_INTERVAL == 0 or i == total_renames:
+                    show_progress(i)
+        elif use_async:
+            # 网络存储上每次重命名都是一次网络往返，使用 asyncio 以更高并发执行
+            _run_async_renames(renames, record_result)
+        else:
+            # 只把实际的重命名 I/O 提交给线程池
+            max_pending = max_workers * 4
+            pending = set()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for src, dst in renames:
+                    # 限制在途任务数量，避免超大目录下 Future 无限堆积
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record_result(future.result())
+                    pending.add(executor.submit(_do_rename, src, dst))
+                
+                # 等待剩余的重命名任务完成
+                for future in as_completed(pending):
+                    record_result(future.result())
+        
+        # 最终状态显示
+        elapsed = time.perf_counter() - start_time
+        print(f"\n处理完成! 用时: {elapsed:.2f}秒 | 总文件: {total_files} | 已更改: {changed_count} | 错误: {error_count}")
+    
+        # 写入汇总信息
+        write_log(f"\n已更改文件: {changed_count}")
+        write_log(f"错误数: {error_count}")
+        write_log(f"用时: {elapsed:.2f}秒")
+    finally:
+        # 无论是否发生异常（包括 Ctrl-C）都关闭日志文件，确保已缓冲的记录写入磁盘
+        if log_file:
+            try:
+                log_file.close()
+                print(f"操作日志已保存至: {output_log}")
+            except (OSError, ValueError) as e:
+                print(f"无法写入日志文件: {str(e)}")
     
     return changed_count, error_count
 
@@ -207,6 +346,20 @@ def main():
         help='将操作日志保存到指定文件\n示例: --log pad_log.txt'
     )
     
+    parser.add_argument(
+        '--async', 
+        dest='use_async',
+        action='store_true', 
+        help=f'使用 asyncio 高并发重命名（最多同时 {ASYNC_CONCURRENCY} 个）\n适用于 SMB/NFS 等网络存储，本地磁盘建议使用默认线程池'
+    )
+    
+    parser.add_argument(
+        '--procs', 
+        type=int, 
+        default=0, 
+        help=f'使用多进程并行计算新文件名的进程数（默认0，不启用）\n仅在文件数不少于 {PROCS_MIN_FILES} 时生效，推荐值: CPU核心数'
+    )
+    
     # 添加示例说明
     parser.epilog = '''
 使用示例:
@@ -224,6 +377,9 @@ def main():
    
 5. 使用8线程处理并保存日志: 
    python pad_chapters.py /path/to/files --workers 8 --log padding_log.txt
+   
+6. 在 NAS 等网络存储上使用异步模式: 
+   python pad_chapters.py "//nas/audiobooks" --async
 
 支持的文件格式:
   音频: .mp3, .wav, .flac, .m4a, .ogg, .aac
@@ -248,14 +404,21 @@ def main():
     # 显示处理信息
     print(f"开始处理目录: {target_dir}")
     print(f"模式: {'试运行（不实际修改）' if args.dry_run else '实际重命名'}")
-    print(f"线程数: {args.workers}")
+    if args.procs > 1:
+        print(f"进程数: {args.procs}")
+    if args.use_async:
+        print(f"异步并发数: {ASYNC_CONCURRENCY}")
+    else:
+        print(f"线程数: {args.workers}")
     
     # 执行转换
     changed, errors = pad_filenames(
         target_dir,
         dry_run=args.dry_run,
         max_workers=args.workers,
-        output_log=args.log
+        output_log=args.log,
+        use_async=args.use_async,
+        procs=args.procs
     )
     
     # 最终结果